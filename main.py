@@ -1,182 +1,603 @@
 import streamlit as st
-from google import genai
-import PyPDF2
 import os
+import hashlib
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+import string
+import json
+import logging
 import re
 from collections import Counter
-import pandas as pd
+from itertools import chain
 from dotenv import load_dotenv
-import markdown
 import io
+import diskcache
+import tenacity
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
 # Configure Gemini API
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
-if GOOGLE_API_KEY:
-    client = genai.Client(api_key=GOOGLE_API_KEY)
-else:
+if not GOOGLE_API_KEY:
     st.error("Please set GOOGLE_API_KEY in your environment variables or .env file")
 
-def extract_text_from_pdf(pdf_file):
-    """Extract text from uploaded PDF file"""
+@functools.cache
+def _get_client():
+    """Create the Gemini client on first use, keeping the SDK import off cold start"""
+    from google import genai
+    return genai.Client(api_key=GOOGLE_API_KEY)
+
+# Local response cache for chunk analyses
+CHUNK_CACHE_DIR = "./.chunk_cache"
+
+# Documents below this many characters fit in a single Gemini 2.0 request
+FULL_DOCUMENT_CHAR_LIMIT = 700_000
+
+# Rough size of a Gemini token in English text, used to budget chunks
+CHARS_PER_TOKEN = 4
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+def iter_pdf_text(data, start=0):
+    """Yield the text of each page of a PDF given as bytes, from page index start"""
+    import pypdfium2 as pdfium
+    
     try:
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text
-    except Exception as e:
-        st.error(f"Error reading PDF: {str(e)}")
+        pdf = pdfium.PdfDocument(data)
+    except pdfium.PdfiumError:
+        # PDFium could not open it (e.g. encrypted), let PyPDF2 try
+        yield from iter_pdf_text_with_pypdf2(io.BytesIO(data), start)
+        return
+    
+    try:
+        for index in range(start, len(pdf)):
+            page = pdf[index]
+            textpage = page.get_textpage()
+            yield textpage.get_text_range() + "\n"
+            textpage.close()
+            page.close()
+    finally:
+        pdf.close()
+
+def iter_pdf_text_with_pypdf2(pdf_file, start=0):
+    """Yield page text with PyPDF2, used when PDFium cannot open the file"""
+    import PyPDF2
+    
+    pdf_reader = PyPDF2.PdfReader(pdf_file)
+    for index in range(start, len(pdf_reader.pages)):
+        yield pdf_reader.pages[index].extract_text() + "\n"
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def read_pdf_head(data):
+    """Return (pages, complete): page text up to FULL_DOCUMENT_CHAR_LIMIT and whether that was all of it"""
+    pages = []
+    length = 0
+    for page_text in iter_pdf_text(data):
+        pages.append(page_text)
+        length += len(page_text)
+        if length >= FULL_DOCUMENT_CHAR_LIMIT:
+            # Too large for one request; the caller resumes after these pages
+            return pages, False
+    return pages, True
+
+def iter_paragraphs(page_iter, max_chars):
+    """Yield paragraphs from streamed page text, splitting any longer than max_chars"""
+    # Pieces of the unfinished paragraph; joined once it ends, since a
+    # paragraph spanning many pages would make repeated += quadratic
+    pending = []
+    for page_text in page_iter:
+        # Re-split trailing whitespace so breaks across the page boundary are found
+        last = pending.pop() if pending else ""
+        stripped = last.rstrip()
+        if stripped:
+            pending.append(stripped)
+        
+        first, *rest = PARAGRAPH_BREAK.split(last[len(stripped):] + page_text)
+        pending.append(first)
+        if rest:
+            yield from split_paragraph("".join(pending), max_chars)
+            for paragraph in rest[:-1]:
+                yield from split_paragraph(paragraph, max_chars)
+            pending = [rest[-1]]
+    yield from split_paragraph("".join(pending), max_chars)
+
+def split_paragraph(paragraph, max_chars):
+    """Yield a paragraph in pieces of at most max_chars, skipping blank ones"""
+    paragraph = paragraph.strip()
+    yield from (paragraph[start:start + max_chars] for start in range(0, len(paragraph), max_chars))
+
+def iter_chunks(page_iter, max_tokens=100_000, overlap_tokens=2_000):
+    """Pack streamed paragraphs into chunks of about max_tokens, overlapping by overlap_tokens"""
+    if overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens must be smaller than max_tokens")
+    
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    overlap_chars = overlap_tokens * CHARS_PER_TOKEN
+    
+    chunk = []
+    size = 0
+    fresh = False  # chunk holds text not yet sent
+    
+    for paragraph in iter_paragraphs(page_iter, max_chars):
+        # Account for the paragraph separator added by the join
+        length = len(paragraph) + 2
+        if fresh and size + length > max_chars:
+            yield "\n\n".join(chunk)
+            
+            # Carry trailing paragraphs into the next chunk as overlap
+            carried = 0
+            for keep in range(len(chunk), 0, -1):
+                if carried + len(chunk[keep - 1]) + 2 > overlap_chars:
+                    break
+                carried += len(chunk[keep - 1]) + 2
+            else:
+                keep = 0
+            chunk = chunk[keep:]
+            size = carried
+            fresh = False
+            
+            if size + length > max_chars:
+                chunk = []
+                size = 0
+        
+        chunk.append(paragraph)
+        size += length
+        fresh = True
+    
+    if fresh:
+        yield "\n\n".join(chunk)
+
+# Bump when CHUNK_SYSTEM_INSTRUCTION changes to invalidate cached chunk analyses
+CHUNK_PROMPT_VERSION = 7
+
+# Structured output of a chunk analysis, validated by Gemini
+CHUNK_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "topics": {"type": "array", "items": {"type": "string"}},
+        "key_terms": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "term": {"type": "string"},
+                    "desc": {"type": "string"}
+                },
+                "required": ["term", "desc"]
+            }
+        },
+        "important_points": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["topics", "key_terms", "important_points"]
+}
+
+# Output budget of one chunk analysis (the gemini-2.0-flash maximum); the item
+# caps in CHUNK_SYSTEM_INSTRUCTION keep a full response well inside it
+CHUNK_MAX_OUTPUT_TOKENS = 8192
+
+# Chunks shorter than this are not split further when their response is truncated
+MIN_SPLIT_CHARS = 4_000
+
+# Smallest prompt gemini-2.0-flash accepts for explicit context caching
+CONTEXT_CACHE_MIN_TOKENS = 4096
+
+# Fixed instructions shared by every chunk request, kept in a Gemini context cache
+# when they reach CONTEXT_CACHE_MIN_TOKENS and sent as system_instruction otherwise
+CHUNK_SYSTEM_INSTRUCTION = """
+You are analyzing one chunk of a PDF document to build a study guide.
+
+Extract ALL topics, subtopics, and concepts from the text chunk you are given. Focus on:
+1. Main topics and their subtopics
+2. Key concepts and terms
+3. Important definitions
+4. Any numbered or bulleted items
+5. Chapter/section titles
+
+Respond with a JSON object containing:
+- "topics": every topic, subtopic, concept and chapter/section title, named with the
+  exact wording used in the text so its mentions can be counted
+- "key_terms": important terms, each with a brief description
+- "important_points": key facts, definitions and takeaways
+
+Be comprehensive and extract everything that could be a study topic or concept, but
+merge near-duplicates and list at most 200 topics, 80 key terms and 40 important points,
+keeping the most important ones.
+
+Example input:
+Chunk 3/12 from "Operating Systems Notes.pdf":
+Chapter 4: Process Scheduling
+4.1 Scheduling Criteria
+CPU utilization, throughput, turnaround time, waiting time and response time are used
+to compare scheduling algorithms. A good scheduler maximizes CPU utilization and
+throughput while minimizing turnaround, waiting and response time.
+4.2 First-Come, First-Served (FCFS)
+FCFS is the simplest non-preemptive algorithm: the process that requests the CPU first
+is allocated the CPU first. It suffers from the convoy effect, where short processes wait
+behind one long process.
+4.3 Shortest-Job-First (SJF)
+SJF associates with each process the length of its next CPU burst and schedules the
+shortest one first. SJF is provably optimal for average waiting time, but the length of
+the next burst must be estimated, typically with an exponential average of previous bursts.
+4.4 Round Robin (RR)
+Each process gets a small unit of CPU time (time quantum), usually 10-100 milliseconds.
+If the quantum is too large RR degenerates to FCFS; if it is too small, context switch
+overhead dominates.
+
+Example output:
+{
+  "topics": [
+    "Process Scheduling",
+    "Scheduling Criteria",
+    "CPU utilization",
+    "Throughput",
+    "Turnaround time",
+    "Waiting time",
+    "Response time",
+    "First-Come, First-Served (FCFS)",
+    "Convoy effect",
+    "Shortest-Job-First (SJF)",
+    "CPU burst",
+    "Exponential average",
+    "Round Robin (RR)",
+    "Time quantum",
+    "Context switch"
+  ],
+  "key_terms": [
+    {"term": "Throughput", "desc": "number of processes completed per time unit"},
+    {"term": "Turnaround time", "desc": "time from submission of a process to its completion"},
+    {"term": "Waiting time", "desc": "total time a process spends in the ready queue"},
+    {"term": "Convoy effect", "desc": "short processes delayed behind one long process under FCFS"},
+    {"term": "Time quantum", "desc": "fixed slice of CPU time given to each process in Round Robin"},
+    {"term": "Non-preemptive scheduling", "desc": "a running process keeps the CPU until it releases it"}
+  ],
+  "important_points": [
+    "A good scheduler maximizes CPU utilization and throughput and minimizes turnaround, waiting and response time",
+    "FCFS is simple but suffers from the convoy effect",
+    "SJF is optimal for average waiting time but needs burst length estimates",
+    "The next CPU burst is usually predicted with an exponential average of previous bursts",
+    "Round Robin quantum size trades responsiveness against context switch overhead"
+  ]
+}
+"""
+
+@st.cache_resource(ttl=540, show_spinner=False)
+def get_chunk_prompt_cache():
+    """Create an explicit context cache holding the chunk instructions"""
+    from google.genai import errors, types
+    
+    client = _get_client()
+    try:
+        # Gemini rejects explicit caches below a minimum size
+        tokens = client.models.count_tokens(
+            model="gemini-2.0-flash",
+            contents=CHUNK_SYSTEM_INSTRUCTION
+        ).total_tokens
+        if tokens < CONTEXT_CACHE_MIN_TOKENS:
+            logger.warning(
+                "Chunk instructions are %d tokens, below the %d-token context cache minimum; "
+                "sending them uncached", tokens, CONTEXT_CACHE_MIN_TOKENS
+            )
+            return None
+        
+        # Refreshed before the 600s server-side TTL runs out
+        cache = client.caches.create(
+            model="gemini-2.0-flash",
+            config=types.CreateCachedContentConfig(
+                system_instruction=CHUNK_SYSTEM_INSTRUCTION,
+                ttl="600s"
+            )
+        )
+        return cache.name
+    except errors.APIError as e:
+        logger.warning("Context caching unavailable, sending chunk instructions uncached: %s", e)
         return None
 
-def chunk_text(text, chunk_size=6000, overlap=500):
-    """Split text into overlapping chunks for processing"""
-    chunks = []
-    start = 0
+@st.cache_resource
+def get_chunk_cache():
+    """Open the on-disk cache of chunk analyses"""
+    # One directory per prompt version so older response formats are never served
+    return diskcache.Cache(os.path.join(CHUNK_CACHE_DIR, f"v{CHUNK_PROMPT_VERSION}"))
+
+def clear_chunk_cache():
+    """Drop all cached chunk analyses"""
+    get_chunk_cache().clear()
+
+@st.cache_resource
+def get_inflight_requests():
+    """Chunk hash -> Future of the analysis currently running for it"""
+    return {}, threading.Lock()
+
+def cached_chunk_analysis(func):
+    """Serve chunk analyses from an on-disk cache keyed by the chunk's SHA-256"""
+    def analyze(cache, key, chunk, chunk_num, total_chunks, pdf_name):
+        result = func(chunk, chunk_num, total_chunks, pdf_name)
+        if result:
+            try:
+                cache.set(key, result)
+            except Exception as e:
+                st.warning(f"Could not cache analysis of chunk {chunk_num}: {str(e)}")
+        return result
     
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end]
-        chunks.append(chunk)
-        start = end - overlap
+    @functools.wraps(func)
+    def wrapper(chunk, chunk_num, total_chunks, pdf_name):
+        key = hashlib.sha256(chunk.encode()).hexdigest()
+        try:
+            cache = get_chunk_cache()
+            result = cache.get(key)
+        except Exception as e:
+            # A broken cache must not cost the chunk its analysis
+            st.warning(f"Chunk cache unavailable: {str(e)}")
+            return func(chunk, chunk_num, total_chunks, pdf_name)
+        if result is not None:
+            return result
         
-        if start >= len(text):
-            break
+        # Share the result of an identical chunk that is already being analyzed,
+        # e.g. one submitted before Streamlit rerun the script
+        inflight, lock = get_inflight_requests()
+        with lock:
+            pending = inflight.get(key)
+            owner = pending is None
+            if owner:
+                pending = inflight[key] = Future()
+        if not owner:
+            return pending.result()
+        
+        try:
+            result = analyze(cache, key, chunk, chunk_num, total_chunks, pdf_name)
+            pending.set_result(result)
+            return result
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with lock:
+                del inflight[key]
+    
+    return wrapper
+
+def is_transient_error(error):
+    """Rate limits (429) and server errors (5xx) are worth retrying"""
+    from google.genai import errors
+    
+    if isinstance(error, errors.ServerError):
+        return True
+    return isinstance(error, errors.ClientError) and error.code == 429
+
+# Retry transient Gemini failures instead of dropping the chunk
+gemini_retry = tenacity.retry(
+    stop=tenacity.stop_after_attempt(5),
+    wait=tenacity.wait_exponential_jitter(initial=1, max=30),
+    retry=tenacity.retry_if_exception(is_transient_error),
+    reraise=True
+)
+
+class TruncatedResponseError(Exception):
+    """Gemini stopped at max_output_tokens before finishing the JSON"""
+
+@st.cache_data(ttl=3600, show_spinner=False)
+@gemini_retry
+def _analyze_chunk(prompt, prompt_version):
+    """Send a chunk prompt to Gemini; errors propagate so failures are not cached"""
+    from google.genai import types
+    
+    cache_name = get_chunk_prompt_cache()
+    if cache_name:
+        config = types.GenerateContentConfig(cached_content=cache_name)
+    else:
+        config = types.GenerateContentConfig(system_instruction=CHUNK_SYSTEM_INSTRUCTION)
+    config.response_mime_type = "application/json"
+    config.response_schema = CHUNK_RESPONSE_SCHEMA
+    config.max_output_tokens = CHUNK_MAX_OUTPUT_TOKENS
+    
+    stream = _get_client().models.generate_content_stream(
+        model="gemini-2.0-flash",
+        contents=prompt,
+        config=config
+    )
+    
+    parts = []
+    finish_reason = None
+    for part in stream:
+        if part.text:
+            parts.append(part.text)
+        if part.candidates and part.candidates[0].finish_reason:
+            finish_reason = part.candidates[0].finish_reason
+    
+    if finish_reason == types.FinishReason.MAX_TOKENS:
+        raise TruncatedResponseError("response exceeded max_output_tokens")
+    return json.loads("".join(parts))
+
+def analyze_chunk_text(chunk, position, pdf_name):
+    """Analyze chunk text, halving it whenever the response is cut off"""
+    prompt = f'Chunk {position} from "{pdf_name}":\n{chunk}'
+    try:
+        return _analyze_chunk(prompt, CHUNK_PROMPT_VERSION)
+    except TruncatedResponseError:
+        if len(chunk) < MIN_SPLIT_CHARS:
+            raise
     
-    return chunks
+    # Split at a paragraph break just before the middle, if there is one
+    half = len(chunk) // 2
+    middle = chunk.rfind("\n\n", half // 2, half)
+    if middle == -1:
+        middle = half
+    first = analyze_chunk_text(chunk[:middle], position, pdf_name)
+    second = analyze_chunk_text(chunk[middle:], position, pdf_name)
+    return {field: first[field] + second[field] for field in first}
+
+def count_topic_mentions(text, topics):
+    """Count case-insensitive whole-word occurrences of each topic name in text"""
+    # Patterns that start with the literal name use re's fast prefix search, which
+    # re.IGNORECASE and a leading lookbehind would both disable
+    folded = text.casefold()
+    counted = {}
+    for name in topics:
+        name = name.strip()
+        key = name.casefold()
+        if not name or key in counted:
+            continue
+        pattern = re.compile(re.escape(key) + r"(?!\w)")
+        count = sum(
+            1 for match in pattern.finditer(folded)
+            if match.start() == 0 or not re.match(r"\w", folded[match.start() - 1])
+        )
+        # Topics the model paraphrased still count once
+        counted[key] = {"name": name, "mentions": max(count, 1)}
+    return list(counted.values())
 
+@cached_chunk_analysis
 def analyze_chunk_with_gemini(chunk, chunk_num, total_chunks, pdf_name):
     """Analyze a single chunk with Gemini"""
     if not GOOGLE_API_KEY:
         return None
     
     try:
-        prompt = f"""
-        You are analyzing chunk {chunk_num} of {total_chunks} from the PDF "{pdf_name}".
-        
-        Extract ALL topics, subtopics, and concepts from this text chunk. Focus on:
-        1. Main topics and their subtopics
-        2. Key concepts and terms
-        3. Important definitions
-        4. Any numbered or bulleted items
-        5. Chapter/section titles
-        
-        Text chunk to analyze:
-        {chunk}
-        
-        Provide your response in this EXACT format:
-        
-        ## TOPICS_FOUND:
-        - Topic 1
-        - Topic 2
-        - Subtopic 1.1
-        - Subtopic 1.2
-        - Concept A
-        - Concept B
-        
-        ## KEY_TERMS:
-        - Term 1: brief description
-        - Term 2: brief description
-        
-        ## IMPORTANT_POINTS:
-        - Point 1
-        - Point 2
-        
-        Be comprehensive and extract everything that could be a study topic or concept.
-        """
-        
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt
-        )
-        return response.text
+        position = f"{chunk_num}/{total_chunks}" if total_chunks else chunk_num
+        result = analyze_chunk_text(chunk, position, pdf_name)
+        result["topics"] = count_topic_mentions(chunk, result["topics"])
+        return result
         
     except Exception as e:
         st.error(f"Error analyzing chunk {chunk_num}: {str(e)}")
         return None
 
+def render_stream(stream):
+    """Show a streamed Gemini response as it arrives and return the full text"""
+    placeholder = st.empty()
+    parts = []
+    try:
+        for part in stream:
+            if part.text:
+                parts.append(part.text)
+                placeholder.markdown("".join(parts))
+    finally:
+        # Also clear partial output when the stream fails and is retried
+        placeholder.empty()
+    return "".join(parts)
+
+# Not st.cache_data: it would record and replay every partial render of the
+# stream; the study guide kept in session state already spares reruns the call
+@gemini_retry
+def _generate_analysis(prompt):
+    """Stream a final analysis from Gemini, showing it as it arrives"""
+    stream = _get_client().models.generate_content_stream(
+        model="gemini-2.0-flash",
+        contents=prompt
+    )
+    return render_stream(stream)
+
+def analyze_full_with_gemini(pdf_text, pdf_name):
+    """Analyze a whole document as a single chunk and build the final analysis from it"""
+    result = analyze_chunk_with_gemini(pdf_text, 1, 1, pdf_name)
+    if not result:
+        return None
+    return combine_and_analyze_topics([result], pdf_name)
+
+def pluralize_mentions(count):
+    """Format a mention count as "1 mention" or "N mentions"."""
+    return f"{count} mention{'s' if count != 1 else ''}"
+
+def format_topic_items(topics, template):
+    """Format (name, count) pairs as bullet lines, or a placeholder when empty"""
+    if not topics:
+        return "- None"
+    return "\n".join(template.format(name=name, mentions=pluralize_mentions(count)) for name, count in topics)
+
 def combine_and_analyze_topics(all_chunk_results, pdf_name):
     """Combine all chunk results and analyze overall topics with frequency"""
     if not GOOGLE_API_KEY:
         return None
     
+    # Sum the per-chunk counts; topic names are merged case-insensitively
+    mentions = Counter()
+    chunks_seen = Counter()
+    names = {}
+    key_terms = {}
+    for result in all_chunk_results:
+        seen = set()
+        for topic in result["topics"]:
+            key = topic["name"].strip().casefold()
+            names.setdefault(key, topic["name"].strip())
+            mentions[key] += topic["mentions"]
+            seen.add(key)
+        chunks_seen.update(seen)
+        for term in result["key_terms"]:
+            key_terms.setdefault(term["term"].strip().casefold(), term)
+    
+    ranked = [(names[key], count) for key, count in mentions.most_common()]
+    high = [(name, count) for name, count in ranked if count >= 5]
+    medium = [(name, count) for name, count in ranked if 2 <= count <= 4]
+    low = [(name, count) for name, count in ranked if count == 1]
+    repeated = "\n".join(
+        f"- {names[key]} appears in {count} of {len(all_chunk_results)} chunks"
+        for key, count in chunks_seen.most_common() if count > 1
+    )
+    terms = "\n".join(f"- **{term['term']}**: {term['desc']}" for term in key_terms.values())
+    
+    # Only the narrative strategy needs the model, from a compact topic summary
     try:
-        # Combine all extracted topics
-        combined_text = "\n\n".join(all_chunk_results)
-        
         prompt = f"""
-        You have analyzed the entire PDF "{pdf_name}" in chunks. Here are all the extracted topics and concepts:
-
-        {combined_text}
-
-        Now provide a comprehensive analysis with the following EXACT format:
-
-        ## COMPLETE_TOPIC_ANALYSIS:
-        ### Main Topics (with frequency estimates):
-        - Topic 1 (estimated frequency: X mentions)
-        - Topic 2 (estimated frequency: Y mentions)
-        - Topic 3 (estimated frequency: Z mentions)
-
-        ### Subtopics and Concepts:
-        - Subtopic 1.1 (frequency: A mentions)
-        - Subtopic 1.2 (frequency: B mentions)
-        - Concept A (frequency: C mentions)
-        - Concept B (frequency: D mentions)
-
-        ## FREQUENCY_CATEGORIZATION:
-        ### High Frequency Topics (5+ mentions) - Critical for Study:
-        - Topic A: X mentions
-        - Topic B: Y mentions
-
-        ### Medium Frequency Topics (2-4 mentions) - Important:
-        - Topic C: Z mentions
-        - Topic D: A mentions
-
-        ### Low Frequency Topics (1 mention) - Supplementary:
-        - Topic E: 1 mention
-        - Topic F: 1 mention
-
-        ## STUDY_CHECKLIST:
-        ### High Priority Study Items:
-        - [ ] Topic A - Master thoroughly (X mentions)
-        - [ ] Topic B - Practice extensively (Y mentions)
-
-        ### Medium Priority Study Items:
-        - [ ] Topic C - Understand well (Z mentions)
-        - [ ] Topic D - Review carefully (A mentions)
-
-        ### Low Priority Study Items:
-        - [ ] Topic E - Basic understanding (1 mention)
-        - [ ] Topic F - Quick review (1 mention)
-
-        ## REPEATED_CONCEPTS:
-        - Concept X appears in multiple sections
-        - Concept Y is mentioned throughout the document
-
-        ## STUDY_STRATEGY:
-        - Focus 70% of time on high-frequency topics
-        - Spend 25% of time on medium-frequency topics
-        - Allocate 5% of time to low-frequency topics
+        You are writing a study strategy for the PDF "{pdf_name}". These are its most
+        frequently mentioned topics:
+
+        {format_topic_items(ranked[:50], "- {name}: {mentions}")}
+
+        Write a short study strategy as a bulleted list. Spend most of the time on the
+        most frequent topics and say roughly what share of study time each group deserves.
+        Respond with the bullet list only.
         """
         
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt
-        )
-        return response.text
+        strategy = _generate_analysis(prompt)
         
     except Exception as e:
-        st.error(f"Error in final analysis: {str(e)}")
-        return None
-
-def create_markdown_from_ai_analysis(analysis_result, pdf_name):
-    """Create markdown output from AI analysis"""
-    if not analysis_result:
-        return "Error: No analysis result available"
+        st.error(f"Error writing study strategy: {str(e)}")
+        strategy = None
     
-    markdown_content = f"""# {pdf_name} - Study Guide
+    if not strategy:
+        strategy = """- Focus 70% of time on high-frequency topics
+- Spend 25% of time on medium-frequency topics
+- Allocate 5% of time to low-frequency topics"""
+    
+    return f"""## COMPLETE_TOPIC_ANALYSIS:
+### Topics by Frequency:
+{format_topic_items(ranked, "- {name} ({mentions})")}
+
+## FREQUENCY_CATEGORIZATION:
+### High Frequency Topics (5+ mentions) - Critical for Study:
+{format_topic_items(high, "- {name}: {mentions}")}
+
+### Medium Frequency Topics (2-4 mentions) - Important:
+{format_topic_items(medium, "- {name}: {mentions}")}
+
+### Low Frequency Topics (1 mention) - Supplementary:
+{format_topic_items(low, "- {name}: {mentions}")}
+
+## STUDY_CHECKLIST:
+### High Priority Study Items:
+{format_topic_items(high, "- [ ] {name} - Master thoroughly ({mentions})")}
+
+### Medium Priority Study Items:
+{format_topic_items(medium, "- [ ] {name} - Understand well ({mentions})")}
+
+### Low Priority Study Items:
+{format_topic_items(low, "- [ ] {name} - Basic understanding ({mentions})")}
+
+## KEY_TERMS:
+{terms or "- None"}
+
+## REPEATED_CONCEPTS:
+{repeated or "- None"}
+
+## STUDY_STRATEGY:
+{strategy.strip()}
+"""
+
+# Static scaffold of the downloadable study guide
+STUDY_GUIDE_TEMPLATE = string.Template("""# $name - Study Guide
 
 ## 📚 AI-Generated Study Guide
 
@@ -184,7 +605,7 @@ This document has been comprehensively analyzed using Gemini AI to create a deta
 
 ---
 
-{analysis_result}
+$analysis
 
 ---
 
@@ -205,9 +626,14 @@ This document has been comprehensively analyzed using Gemini AI to create a deta
 ---
 
 *Generated by PDF Study Guide Generator with Gemini AI*
-"""
+""")
+
+def create_markdown_from_ai_analysis(analysis_result, pdf_name):
+    """Create markdown output from AI analysis"""
+    if not analysis_result:
+        return "Error: No analysis result available"
     
-    return markdown_content
+    return STUDY_GUIDE_TEMPLATE.substitute(name=pdf_name, analysis=analysis_result)
 
 def main():
     st.set_page_config(
@@ -228,6 +654,20 @@ def main():
             st.info("Please set GOOGLE_API_KEY in your environment variables")
             st.stop()
         
+        max_workers = st.slider(
+            "Parallel requests",
+            min_value=1,
+            max_value=20,
+            value=10,
+            help="Number of chunks analyzed concurrently by Gemini"
+        )
+        
+        if st.button("🗑️ Clear cache", help="Forget cached text extraction and analyses"):
+            clear_chunk_cache()
+            st.cache_data.clear()
+            st.session_state.pop("study_guide", None)
+            st.success("Cache cleared")
+        
         st.markdown("---")
         st.markdown("### How to use:")
         st.markdown("1. Upload your PDF file")
@@ -237,6 +677,7 @@ def main():
     
     # Main content area
     col1, col2 = st.columns([2, 1])
+    chunk_stats = None
     
     with col1:
         st.header("📄 Upload PDF")
@@ -250,69 +691,147 @@ def main():
         if uploaded_file is not None:
             st.success(f"✅ File uploaded: {uploaded_file.name}")
             
-            # Extract text from PDF
-            with st.spinner("Extracting text from PDF..."):
-                pdf_text = extract_text_from_pdf(uploaded_file)
-            
-            if pdf_text:
-                st.info(f"📊 Extracted {len(pdf_text)} characters of text")
+            # Reuse the study guide built for this upload; reruns from widget
+            # interactions then never repeat the pipeline or rebuild the markdown
+            study_guide = st.session_state.get("study_guide")
+            if study_guide is not None and study_guide["file_id"] == uploaded_file.file_id:
+                # Chunk stats are stored with the guide so the status panel survives reruns
+                chunk_stats = study_guide.get("chunk_stats")
+            else:
+                # Raw bytes key the extraction and analysis caches across reruns
+                file_bytes = uploaded_file.getvalue()
                 
-                # Chunk the text
-                chunks = chunk_text(pdf_text)
-                st.info(f"📑 Split into {len(chunks)} chunks for analysis")
+                # Small documents are analyzed in one request; larger ones (None) are chunked
+                try:
+                    with st.spinner("Extracting text from PDF..."):
+                        head_pages, complete = read_pdf_head(file_bytes)
+                    pdf_text = "".join(head_pages) if complete else None
+                except Exception as e:
+                    st.error(f"Error reading PDF: {str(e)}")
+                    pdf_text = ""
                 
-                # Analyze each chunk
-                all_chunk_results = []
-                progress_bar = st.progress(0)
-                status_text = st.empty()
-                
-                for i, chunk in enumerate(chunks):
-                    status_text.text(f"Analyzing chunk {i+1} of {len(chunks)}...")
-                    with st.spinner(f"🤖 Analyzing chunk {i+1}/{len(chunks)}"):
-                        result = analyze_chunk_with_gemini(chunk, i+1, len(chunks), uploaded_file.name)
-                        if result:
-                            all_chunk_results.append(result)
-                    progress_bar.progress((i + 1) / len(chunks))
+                final_analysis = None
+                if pdf_text:
+                    st.info(f"📊 Extracted {len(pdf_text)} characters of text")
+                    
+                    with st.spinner("🤖 Analyzing the whole document in a single request..."):
+                        final_analysis = analyze_full_with_gemini(pdf_text, uploaded_file.name)
+                    
+                    if not final_analysis:
+                        st.error("❌ Failed to create final analysis")
                 
-                if all_chunk_results:
-                    st.success(f"✅ Successfully analyzed {len(all_chunk_results)} chunks")
+                elif pdf_text is None:
+                    results = {}
+                    futures = {}
+                    progress_bar = st.progress(0)
+                    status_text = st.empty()
+                    status_text.text(f"Extracting and analyzing chunks with {max_workers} workers...")
                     
-                    # Combine and analyze all results
-                    with st.spinner("🔍 Combining analysis and creating final study guide..."):
-                        final_analysis = combine_and_analyze_topics(all_chunk_results, uploaded_file.name)
+                    # Create the prompt cache once before the workers share it
+                    try:
+                        get_chunk_prompt_cache()
+                    except Exception as e:
+                        st.warning(f"Context caching unavailable: {str(e)}")
                     
-                    if final_analysis:
-                        st.success("✅ Final analysis completed!")
-                        
-                        # Generate markdown
-                        markdown_output = create_markdown_from_ai_analysis(final_analysis, uploaded_file.name)
+                    # Attach the script context so st.error works from worker threads
+                    ctx = get_script_run_ctx()
+                    in_flight = threading.BoundedSemaphore(max_workers * 2)
+                    with st.spinner("🤖 Extracting text and analyzing chunks..."):
+                        with ThreadPoolExecutor(
+                            max_workers=max_workers,
+                            initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)
+                        ) as executor:
+                            # Submit each chunk as soon as extraction produces it;
+                            # the total is unknown until the whole PDF has been read.
+                            # Pages already read for the size check are not extracted again
+                            pages = chain(head_pages, iter_pdf_text(file_bytes, start=len(head_pages)))
+                            try:
+                                for i, chunk in enumerate(iter_chunks(pages)):
+                                    # Pause extraction while workers are behind so queued chunks stay bounded
+                                    in_flight.acquire()
+                                    future = executor.submit(analyze_chunk_with_gemini, chunk, i+1, None, uploaded_file.name)
+                                    future.add_done_callback(lambda _: in_flight.release())
+                                    futures[future] = i
+                            except Exception as e:
+                                st.error(f"Error reading PDF: {str(e)}")
+                                executor.shutdown(cancel_futures=True)
+                                futures = {}
+                            
+                            for done, future in enumerate(as_completed(futures), start=1):
+                                try:
+                                    results[futures[future]] = future.result()
+                                except Exception as e:
+                                    st.error(f"Error analyzing chunk {futures[future] + 1}: {str(e)}")
+                                    results[futures[future]] = None
+                                status_text.text(f"Analyzed {done} of {len(futures)} chunks...")
+                                progress_bar.progress(done / len(futures))
+                    
+                    chunk_count = len(futures)
+                    if chunk_count:
+                        st.info(f"📑 Split into {chunk_count} chunks for analysis")
                         
-                        # Display preview
-                        st.header("📖 Generated Study Guide Preview")
-                        st.markdown("---")
-                        st.markdown(markdown_output[:3000] + "..." if len(markdown_output) > 3000 else markdown_output)
+                        # Keep results in chunk order
+                        all_chunk_results = [results[i] for i in sorted(results) if results[i]]
+                        chunk_stats = {
+                            "chunk_count": chunk_count,
+                            "analyzed": len(all_chunk_results),
+                            "distinct_topics": len({
+                                topic["name"].strip().casefold()
+                                for result in all_chunk_results
+                                for topic in result["topics"]
+                            })
+                        }
                         
-                        # Download button
-                        st.download_button(
-                            label="📥 Download Markdown Study Guide",
-                            data=markdown_output,
-                            file_name=f"{uploaded_file.name.replace('.pdf', '')}_study_guide.md",
-                            mime="text/markdown"
-                        )
-                    else:
-                        st.error("❌ Failed to create final analysis")
+                        if all_chunk_results:
+                            st.success(f"✅ Successfully analyzed {len(all_chunk_results)} chunks")
+                            
+                            # Combine and analyze all results
+                            with st.spinner("🔍 Combining analysis and creating final study guide..."):
+                                final_analysis = combine_and_analyze_topics(all_chunk_results, uploaded_file.name)
+                            
+                            if not final_analysis:
+                                st.error("❌ Failed to create final analysis")
+                        else:
+                            st.error("❌ No chunks were successfully analyzed")
+                
+                if final_analysis:
+                    st.success("✅ Final analysis completed!")
+                    
+                    # Generate markdown
+                    study_guide = {
+                        "file_id": uploaded_file.file_id,
+                        "markdown": create_markdown_from_ai_analysis(final_analysis, uploaded_file.name),
+                        "chunk_stats": chunk_stats
+                    }
+                    st.session_state["study_guide"] = study_guide
                 else:
-                    st.error("❌ No chunks were successfully analyzed")
+                    study_guide = None
+            
+            if study_guide is not None:
+                markdown_output = study_guide["markdown"]
+                
+                # Display preview
+                st.header("📖 Generated Study Guide Preview")
+                st.markdown("---")
+                st.markdown(markdown_output[:3000] + "..." if len(markdown_output) > 3000 else markdown_output)
+                
+                # Download button
+                st.download_button(
+                    label="📥 Download Markdown Study Guide",
+                    data=markdown_output,
+                    file_name=f"{uploaded_file.name.replace('.pdf', '')}_study_guide.md",
+                    mime="text/markdown"
+                )
     
     with col2:
         st.header("📊 Analysis Progress")
         
-        if 'chunks' in locals():
+        if chunk_stats:
             st.subheader("📑 Processing Status")
-            st.markdown(f"- **Total Chunks**: {len(chunks)}")
-            if 'all_chunk_results' in locals():
-                st.markdown(f"- **Analyzed**: {len(all_chunk_results)}")
-                st.markdown(f"- **Success Rate**: {len(all_chunk_results)/len(chunks)*100:.1f}%")
+            st.markdown(f"- **Total Chunks**: {chunk_stats['chunk_count']}")
+            st.markdown(f"- **Analyzed**: {chunk_stats['analyzed']}")
+            st.markdown(f"- **Distinct Topics**: {chunk_stats['distinct_topics']}")
+            st.markdown(f"- **Success Rate**: {chunk_stats['analyzed']/chunk_stats['chunk_count']*100:.1f}%")
         
         st.markdown("---")
         st.markdown("### 💡 AI Analysis Features")
@@ -0,0 +1,11 @@
+import importlib.util
+import os
+import sys
+
+# main.py lives at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main.py imports these at module level, so no test module can load without them
+REQUIRED_MODULES = ("streamlit", "diskcache", "tenacity", "dotenv")
+if any(importlib.util.find_spec(name) is None for name in REQUIRED_MODULES):
+    collect_ignore_glob = ["test_*.py"]
@@ -0,0 +1,64 @@
+import diskcache
+import pytest
+
+import main
+
+
+def fake_analysis(limit):
+    """Stand-in for _analyze_chunk that truncates prompts longer than limit"""
+    def analyze(prompt, prompt_version):
+        if len(prompt) > limit:
+            raise main.TruncatedResponseError("response exceeded max_output_tokens")
+        body = prompt.split("\n", 1)[1]
+        return {"topics": [body[:10]], "key_terms": [], "important_points": [body[:10]]}
+    return analyze
+
+
+def test_truncated_response_splits_chunk(monkeypatch):
+    paragraphs = [f"Paragraph {i} " + "x" * 1000 for i in range(12)]
+    chunk = "\n\n".join(paragraphs)
+    monkeypatch.setattr(main, "_analyze_chunk", fake_analysis(len(chunk) // 2))
+
+    result = main.analyze_chunk_text(chunk, 1, "book.pdf")
+
+    assert len(result["topics"]) >= 2
+    assert len(result["topics"]) == len(result["important_points"])
+    assert result["topics"][0] == "Paragraph "
+
+
+def test_short_truncated_chunk_is_reported(monkeypatch):
+    monkeypatch.setattr(main, "_analyze_chunk", fake_analysis(0))
+
+    with pytest.raises(main.TruncatedResponseError):
+        main.analyze_chunk_text("short chunk", 1, "book.pdf")
+
+
+def test_topic_mentions_are_counted_in_chunk_text():
+    text = "Mitosis divides a cell. MITOSIS has four phases; cells and cellular parts differ."
+
+    counted = main.count_topic_mentions(text, ["Mitosis", "cell", "mitosis", "Meiosis"])
+
+    assert counted == [
+        {"name": "Mitosis", "mentions": 2},
+        {"name": "cell", "mentions": 1},
+        {"name": "Meiosis", "mentions": 1},
+    ]
+
+
+def test_full_document_uses_chunk_guide_layout(monkeypatch, tmp_path):
+    cache = diskcache.Cache(str(tmp_path))
+    monkeypatch.setattr(main, "GOOGLE_API_KEY", "key")
+    monkeypatch.setattr(main, "get_chunk_cache", lambda: cache)
+    monkeypatch.setattr(main, "_analyze_chunk", lambda prompt, prompt_version: {
+        "topics": ["Photosynthesis", "Chlorophyll"],
+        "key_terms": [{"term": "Chlorophyll", "desc": "green pigment"}],
+        "important_points": [],
+    })
+    monkeypatch.setattr(main, "_generate_analysis", lambda prompt: "- Review photosynthesis first")
+
+    text = "Photosynthesis uses chlorophyll. Photosynthesis makes glucose. " * 3
+    analysis = main.analyze_full_with_gemini(text, "biology.pdf")
+    cache.close()
+
+    assert "### Topics by Frequency:\n- Photosynthesis (6 mentions)\n- Chlorophyll (3 mentions)" in analysis
+    assert "## KEY_TERMS:\n- **Chlorophyll**: green pigment" in analysis
@@ -0,0 +1,57 @@
+import threading
+
+import diskcache
+import pytest
+
+import main
+
+CHAPTER_ONE = """Chapter 3: Cell Structure and Function
+
+All living organisms are made of cells, the smallest units that can carry out the
+processes of life. Prokaryotic cells, such as bacteria, lack a nucleus and
+membrane-bound organelles; their DNA lies in a region called the nucleoid.
+Eukaryotic cells keep their DNA inside a nucleus surrounded by a double membrane.
+
+The plasma membrane is a phospholipid bilayer with embedded proteins. It is
+selectively permeable: small nonpolar molecules diffuse across it, while ions and
+large polar molecules need transport proteins. Active transport, such as the
+sodium-potassium pump, moves substances against their concentration gradient
+using energy from ATP.
+
+Mitochondria carry out cellular respiration and produce most of the cell's ATP.
+Chloroplasts, found in plants and algae, capture light energy in photosynthesis.
+The endoplasmic reticulum synthesizes proteins and lipids, and the Golgi apparatus
+modifies, sorts and packages them for secretion or delivery to other organelles.
+Lysosomes contain digestive enzymes that break down worn-out organelles.
+"""
+
+
+@pytest.fixture
+def chunk_cache(tmp_path, monkeypatch):
+    cache = diskcache.Cache(str(tmp_path))
+    inflight = ({}, threading.Lock())
+    monkeypatch.setattr(main, "get_chunk_cache", lambda: cache)
+    monkeypatch.setattr(main, "get_inflight_requests", lambda: inflight)
+    yield cache
+    cache.close()
+
+
+def test_repeated_chunk_is_served_from_cache(chunk_cache):
+    calls = []
+
+    @main.cached_chunk_analysis
+    def analyze(chunk, chunk_num, total_chunks, pdf_name):
+        calls.append(chunk_num)
+        return {"chunk": chunk_num}
+
+    assert analyze(CHAPTER_ONE, 1, None, "biology.pdf") == {"chunk": 1}
+    assert analyze(CHAPTER_ONE, 5, None, "biology.pdf") == {"chunk": 1}
+    assert calls == [1]
+
+
+def test_clear_cache_drops_analyses(chunk_cache):
+    chunk_cache.set("key", {"chunk": 1})
+
+    main.clear_chunk_cache()
+
+    assert len(chunk_cache) == 0
@@ -0,0 +1,39 @@
+from itertools import chain
+
+import pytest
+
+import main
+
+PAGE_CHARS = 300_000
+
+
+@pytest.fixture
+def fake_pdf(monkeypatch):
+    """Five large pages; records the index of every page extracted"""
+    extracted = []
+
+    def iter_pages(data, start=0):
+        for index in range(start, 5):
+            extracted.append(index)
+            yield f"Page {index}\n\n" + "x" * PAGE_CHARS + "\n"
+
+    monkeypatch.setattr(main, "iter_pdf_text", iter_pages)
+    main.read_pdf_head.clear()
+    yield extracted
+    main.read_pdf_head.clear()
+
+
+def test_head_stops_at_full_document_limit(fake_pdf):
+    pages, complete = main.read_pdf_head(b"large pdf")
+
+    assert not complete
+    assert len(pages) * PAGE_CHARS >= main.FULL_DOCUMENT_CHAR_LIMIT
+    assert fake_pdf == list(range(len(pages)))
+
+
+def test_chunk_path_resumes_after_head(fake_pdf):
+    pages, _ = main.read_pdf_head(b"large pdf")
+    text = "".join(chain(pages, main.iter_pdf_text(b"large pdf", start=len(pages))))
+
+    assert fake_pdf == [0, 1, 2, 3, 4]
+    assert [f"Page {index}" in text for index in range(5)] == [True] * 5
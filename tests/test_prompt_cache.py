@@ -0,0 +1,37 @@
+from unittest import mock
+
+import pytest
+
+import main
+
+
+def test_chunk_instructions_stay_below_context_cache_minimum():
+    # Small enough to send uncached as system_instruction; padding them past the
+    # minimum would cost more than caching saves
+    estimated_tokens = len(main.CHUNK_SYSTEM_INSTRUCTION) / main.CHARS_PER_TOKEN
+    assert estimated_tokens < main.CONTEXT_CACHE_MIN_TOKENS
+
+
+@pytest.fixture
+def client(monkeypatch):
+    pytest.importorskip("google.genai")
+    client = mock.Mock()
+    monkeypatch.setattr(main, "_get_client", lambda: client)
+    main.get_chunk_prompt_cache.clear()
+    yield client
+    main.get_chunk_prompt_cache.clear()
+
+
+def test_prompt_cache_created_above_minimum(client):
+    client.models.count_tokens.return_value.total_tokens = main.CONTEXT_CACHE_MIN_TOKENS + 1
+    client.caches.create.return_value.name = "cachedContents/abc"
+
+    assert main.get_chunk_prompt_cache() == "cachedContents/abc"
+
+
+def test_prompt_cache_skipped_below_minimum(client, caplog):
+    client.models.count_tokens.return_value.total_tokens = main.CONTEXT_CACHE_MIN_TOKENS - 1
+
+    assert main.get_chunk_prompt_cache() is None
+    client.caches.create.assert_not_called()
+    assert "context cache minimum" in caplog.text